@@ -5,12 +5,10 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
-from pydantic import BaseModel
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,34 +20,56 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # connect=False: no sockets or monitor threads until first use inside a worker's event loop.
+    # minPoolSize keeps warm connections so bursts don't pay for cold connects;
+    # zstd wire compression falls back to zlib if zstandard is unavailable.
+    _client = AsyncIOMotorClient(
+        database_url,
+        connect=False,
+        maxPoolSize=200,
+        minPoolSize=20,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=2000,
+        socketTimeoutMS=5000,
+        retryWrites=True,
+        compressors="zstd,zlib",
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+def require_db():
+    """Raise if the database is not configured"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    # Convert Pydantic model to dict if needed
-    if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
-    else:
-        data_dict = data.copy()
+async def create_document(collection_name: str, data: dict):
+    """Insert a single document with timestamp (pass model_dump() output for Pydantic models)"""
+    require_db()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    data_dict = data.copy()
 
-    result = db[collection_name].insert_one(data_dict)
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
+
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+def iter_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: list = None, skip: int = 0, projection: dict = None):
+    """Get a lazy async cursor over documents, optionally projected, sorted and paginated server-side"""
+    require_db()
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if skip:
+        cursor = cursor.skip(skip)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return cursor
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: list = None, skip: int = 0, projection: dict = None):
+    """Get documents from collection, optionally projected, sorted and paginated server-side"""
+    cursor = iter_documents(collection_name, filter_dict, limit=limit, sort=sort, skip=skip, projection=projection)
+    return await cursor.to_list(length=None)
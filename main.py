@@ -1,15 +1,50 @@
 import os
-from fastapi import FastAPI, HTTPException, Depends
+import re
+import time
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, ValidationError
+from typing import List, Optional, Tuple
+from functools import lru_cache
+from contextlib import asynccontextmanager
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
 from datetime import datetime, timezone
 
-from database import db, create_document, get_documents
-from schemas import Service, Request as RequestSchema, User as UserSchema, Business
+from database import db, require_db, create_document, get_documents, iter_documents
+from schemas import Service, Request as RequestSchema, User as UserSchema
 
-app = FastAPI()
+# PyMongo returns naive datetimes that are UTC; emit them as "...Z"
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+class UTCJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+async def ensure_indexes():
+    if db is None:
+        return
+    # Back the newest-first listing in list_requests, with and without a status filter.
+    # A failure must not stop the app from booting: /test reports database problems.
+    try:
+        await db["request"].create_index([("status", 1), ("created_at", -1)])
+        await db["request"].create_index([("created_at", -1)])
+    except PyMongoError as e:
+        print(f"[DB] Index creation failed: {str(e)[:80]}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process
+    await ensure_indexes()
+    yield
+
+app = FastAPI(default_response_class=UTCJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,6 +53,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Small bodies like {"ok": true} are sent uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=500)
 
 # Helpers
 class IDModel(BaseModel):
@@ -27,12 +64,41 @@ def to_public(doc):
     if not doc:
         return doc
     doc["id"] = str(doc.pop("_id"))
-    # Convert datetimes to iso
-    for k, v in list(doc.items()):
-        if isinstance(v, datetime):
-            doc[k] = v.isoformat()
     return doc
 
+async def parse_oid(req_id: str) -> ObjectId:
+    """Path dependency: parse req_id once, 400 on malformed IDs"""
+    try:
+        return ObjectId(req_id)
+    except InvalidId:
+        raise HTTPException(400, "ID invalide")
+
+def send_email(message: str):
+    # Email hooks are simulated by logs
+    print(f"[EMAIL] {message}")
+
+async def insert_log(collection_name: str, doc: dict):
+    """Raw insert for audit entries, meant to run as a background task"""
+    # Errors are logged, not raised, so tasks queued after this one still run
+    try:
+        await db[collection_name].insert_one(doc)
+    except PyMongoError as e:
+        print(f"[DB] {collection_name} insert failed: {str(e)[:80]}")
+
+async def insert_lead(req: dict):
+    """Background insert for an auto-created lead whose _id was already returned"""
+    try:
+        await create_document("request", req)
+    except PyMongoError as e:
+        print(f"[DB] lead {req['_id']} insert failed: {str(e)[:80]}")
+
+async def json_array_stream(first, cursor):
+    """Yield a JSON array one public document at a time, starting from an already-read first document"""
+    yield b"[" + orjson.dumps(to_public(first), option=ORJSON_OPTIONS)
+    async for d in cursor:
+        yield b"," + orjson.dumps(to_public(d), option=ORJSON_OPTIONS)
+    yield b"]"
+
 # Onboarding payload for content generation
 class OnboardingPayload(BaseModel):
     nom: str
@@ -42,12 +108,15 @@ class OnboardingPayload(BaseModel):
     horaires: str
 
 # Simple text generators (rule-based placeholders)
+# Pure functions of their inputs, so results are memoized; treat them as read-only.
 
+@lru_cache(maxsize=256)
 def generate_intro(nom, metier, localisation):
     return f"{nom}, {metier} à {localisation}. Prenez rendez-vous facilement : nous répondons vite et organisons tout pour vous. Des prestations de qualité avec un accueil soigné."
 
 
-def generate_service_descriptions(services: List[str]):
+@lru_cache(maxsize=256)
+def generate_service_descriptions(services: Tuple[str, ...]):
     out = []
     for s in services:
         out.append({
@@ -57,6 +126,7 @@ def generate_service_descriptions(services: List[str]):
     return out
 
 
+@lru_cache(maxsize=256)
 def generate_faq(nom, metier, localisation, horaires):
     return [
         {"q": "Quels sont vos horaires ?", "a": f"{horaires}. N'hésitez pas à nous écrire pour un créneau spécifique."},
@@ -66,6 +136,7 @@ def generate_faq(nom, metier, localisation, horaires):
     ]
 
 
+@lru_cache(maxsize=256)
 def generate_assistant_responses(metier):
     return [
         "Bonjour ! Comment puis-je vous aider aujourd'hui ?",
@@ -73,12 +144,19 @@ def generate_assistant_responses(metier):
         "Pour confirmer une demande, partagez votre nom, email et téléphone.",
     ]
 
+# Served by /api/content until a business has been onboarded
+_FALLBACK_CONTENT = {
+    "intro": generate_intro("Votre Nom", "Votre métier", "Votre ville"),
+    "faq": generate_faq("", "", "", "Lun-Ven 9h-18h"),
+    "services": generate_service_descriptions(("Consultation", "Accompagnement", "Séance")),
+}
+
 @app.get("/")
-def root():
+async def root():
     return {"message": "Backend up"}
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -93,78 +171,85 @@ def test_database():
             response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
             response["database_name"] = db.name
             response["connection_status"] = "Connected"
-            response["collections"] = db.list_collection_names()
+            response["collections"] = await db.list_collection_names()
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:80]}"
     return response
 
 # --------- Services ---------
-@app.post("/api/services", response_model=dict)
-def create_service(payload: Service):
-    service_id = create_document("service", payload)
-    return {"id": service_id}
+@app.post("/api/services")
+async def create_service(payload: Service):
+    service_id = await create_document("service", payload.model_dump())
+    return UTCJSONResponse({"id": service_id})
 
-@app.get("/api/services", response_model=List[dict])
-def list_services():
-    docs = get_documents("service")
-    return [to_public(d) for d in docs]
+@app.get("/api/services")
+async def list_services():
+    docs = await get_documents("service")
+    return UTCJSONResponse([to_public(d) for d in docs])
 
 # --------- Requests (leads) ---------
-@app.post("/api/requests", response_model=dict)
-def create_request(payload: RequestSchema):
+@app.post("/api/requests")
+async def create_request(payload: RequestSchema, background: BackgroundTasks):
     data = payload.model_dump()
-    data["created_at"] = datetime.now(timezone.utc)
-    rid = create_document("request", data)
-    # Simple email hooks simulated by logs
-    try:
-        print(f"[EMAIL] Nouvelle demande: {data['name']} - {data.get('email')}")
-    except Exception:
-        pass
-    return {"id": rid}
+    # created_at/updated_at are stamped by create_document
+    rid = await create_document("request", data)
+    background.add_task(send_email, f"Nouvelle demande: {data['name']} - {data.get('email')}")
+    return UTCJSONResponse({"id": rid})
+
+# Fields shown in the leads list; full documents come from get_request
+_REQUEST_LIST_FIELDS = {"name": 1, "email": 1, "phone": 1, "status": 1, "created_at": 1, "service_id": 1}
 
-@app.get("/api/requests", response_model=List[dict])
-def list_requests(status: Optional[str] = None):
+@app.get("/api/requests")
+async def list_requests(status: Optional[str] = None, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
     filt = {"status": status} if status else {}
-    res = [to_public(d) for d in get_documents("request", filt)]
-    # sort desc by created_at
-    res.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    return res
+    # newest first, sorted and paginated by Mongo; streamed as the cursor yields
+    cursor = iter_documents("request", filt, limit=limit, sort=[("created_at", -1)], skip=skip, projection=_REQUEST_LIST_FIELDS)
+    # Read the first document before any headers go out, so a failing query is still a 500
+    try:
+        first = await cursor.next()
+    except StopAsyncIteration:
+        return UTCJSONResponse([])
+    return StreamingResponse(json_array_stream(first, cursor), media_type="application/json")
 
 @app.get("/api/requests/{req_id}")
-def get_request(req_id: str):
-    doc = db["request"].find_one({"_id": ObjectId(req_id)})
+async def get_request(oid: ObjectId = Depends(parse_oid)):
+    doc = await db["request"].find_one({"_id": oid})
     if not doc:
         raise HTTPException(404, "Demande introuvable")
-    return to_public(doc)
+    return UTCJSONResponse(to_public(doc))
 
 class StatusUpdate(BaseModel):
     status: str
 
 @app.post("/api/requests/{req_id}/status")
-def update_status(req_id: str, payload: StatusUpdate):
+async def update_status(payload: StatusUpdate, background: BackgroundTasks, oid: ObjectId = Depends(parse_oid)):
     if payload.status not in ["Nouveau", "Confirmé", "Annulé"]:
         raise HTTPException(400, "Statut invalide")
-    result = db["request"].update_one({"_id": ObjectId(req_id)}, {"$set": {"status": payload.status, "updated_at": datetime.now(timezone.utc)}})
-    if result.matched_count == 0:
+    # One timestamp shared by the request and its history entry
+    now = datetime.now(timezone.utc)
+    # Update and read back in one round-trip; the email is reused below
+    doc = await db["request"].find_one_and_update(
+        {"_id": oid},
+        {"$set": {"status": payload.status, "updated_at": now}},
+        projection={"email": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
         raise HTTPException(404, "Demande introuvable")
-    # Log history
-    db["request_log"].insert_one({
-        "request_id": ObjectId(req_id),
+    # Email and history log are sent after the response
+    if payload.status == "Confirmé":
+        background.add_task(send_email, f"Confirmation envoyée à {doc.get('email')}")
+    background.add_task(insert_log, "request_log", {
+        "request_id": oid,
         "status": payload.status,
-        "timestamp": datetime.now(timezone.utc)
+        "timestamp": now
     })
-    if payload.status == "Confirmé":
-        try:
-            doc = db["request"].find_one({"_id": ObjectId(req_id)})
-            print(f"[EMAIL] Confirmation envoyée à {doc.get('email')}")
-        except Exception:
-            pass
     return {"ok": True}
 
 @app.get("/api/requests/{req_id}/history")
-def get_history(req_id: str):
-    logs = list(db["request_log"].find({"request_id": ObjectId(req_id)}))
-    return [to_public(l) for l in logs]
+async def get_history(oid: ObjectId = Depends(parse_oid)):
+    logs = await get_documents("request_log", {"request_id": oid}, projection={"status": 1, "timestamp": 1})
+    return UTCJSONResponse([to_public(l) for l in logs])
 
 # --------- Auth (very simple) ---------
 class LoginPayload(BaseModel):
@@ -172,42 +257,46 @@ class LoginPayload(BaseModel):
     password: str
 
 @app.post("/api/auth/login")
-def login(payload: LoginPayload):
-    user = db["user"].find_one({"email": payload.email})
+async def login(payload: LoginPayload):
+    user = await db["user"].find_one({"email": payload.email})
     if not user or user.get("password") != payload.password:
         raise HTTPException(401, "Identifiants invalides")
     return {"token": "demo-token", "user": {"name": user.get("name"), "email": user.get("email")}}
 
 # --------- Onboarding & content generation ---------
 @app.post("/api/onboarding")
-def onboarding(payload: OnboardingPayload):
+async def onboarding(payload: OnboardingPayload):
     # Store business profile and generated content
     intro = generate_intro(payload.nom, payload.metier, payload.localisation)
-    service_desc = generate_service_descriptions(payload.services)
+    service_desc = generate_service_descriptions(tuple(payload.services))
     faq = generate_faq(payload.nom, payload.metier, payload.localisation, payload.horaires)
     assistant_res = generate_assistant_responses(payload.metier)
 
-    biz = Business(
-        owner_name=payload.nom,
-        métier=payload.metier,
-        localisation=payload.localisation,
-        services=payload.services,
-        horaires=payload.horaires,
-        intro_paragraph=intro,
-        faq=faq,
-        service_descriptions=service_desc,
-        assistant_responses=assistant_res,
-    )
-    bid = create_document("business", biz)
+    # Matches schemas.Business; the payload is already validated
+    biz = {
+        "owner_name": payload.nom,
+        "métier": payload.metier,
+        "localisation": payload.localisation,
+        "services": payload.services,
+        "horaires": payload.horaires,
+        "intro_paragraph": intro,
+        "faq": faq,
+        "service_descriptions": service_desc,
+        "assistant_responses": assistant_res,
+    }
+    bid = await create_document("business", biz)
+    _content_cache["generation"] += 1
+    _content_cache["expires"] = 0.0
     return {"id": bid, "intro": intro, "faq": faq, "services": service_desc, "assistant": assistant_res}
 
+# Fields read by get_content
+_CONTENT_FIELDS = {"intro_paragraph": 1, "faq": 1, "service_descriptions": 1, "horaires": 1, "localisation": 1, "métier": 1, "owner_name": 1}
+
 @app.get("/api/content")
-def get_content():
-    biz = db["business"].find_one(sort=[("_id", -1)])
+async def get_content():
+    biz = await db["business"].find_one(sort=[("_id", -1)], projection=_CONTENT_FIELDS)
     if not biz:
-        return {"intro": generate_intro("Votre Nom", "Votre métier", "Votre ville"),
-                "faq": generate_faq("", "", "", "Lun-Ven 9h-18h"),
-                "services": generate_service_descriptions(["Consultation", "Accompagnement", "Séance"])}
+        return _FALLBACK_CONTENT
     biz = to_public(biz)
     return {
         "intro": biz.get("intro_paragraph"),
@@ -219,37 +308,60 @@ def get_content():
         "owner": biz.get("owner_name"),
     }
 
+# Latest business content, kept in-process for a short TTL so the assistant
+# hot path does not hit the business collection on every message.
+# Per-worker only: with several workers, onboarding invalidates just its own copy.
+CONTENT_CACHE_TTL = 30.0
+# "generation" is bumped on invalidation so a refill that started earlier is discarded.
+_content_cache = {"value": None, "expires": 0.0, "generation": 0}
+
+async def _cached_content():
+    now = time.monotonic()
+    if _content_cache["value"] is not None and now < _content_cache["expires"]:
+        return _content_cache["value"]
+    generation = _content_cache["generation"]
+    content = await get_content()
+    if _content_cache["generation"] == generation:
+        _content_cache["value"] = content
+        _content_cache["expires"] = now + CONTENT_CACHE_TTL
+    return content
+
 # --------- Assistant (rule-based) ---------
 class ChatMessage(BaseModel):
     message: str
     name: Optional[str] = None
-    email: Optional[EmailStr] = None
+    email: Optional[str] = None  # validated only when a request is auto-created
     phone: Optional[str] = None
     service: Optional[str] = None
 
+# Keyword groups, compiled once; group names key into _INTENT_REPLIES
+_INTENT_RE = re.compile(
+    r"(?P<horaire>horaire|heures|ouvert)"
+    r"|(?P<prix>prix|tarif)"
+    r"|(?P<lieu>où|adresse|localisation|lieu)"
+    r"|(?P<service>service|choisir|conseil)"
+)
+
+_INTENT_REPLIES = {
+    "horaire": lambda content: next((f["a"] for f in content.get("faq", []) if "horaire" in f["q"].lower()), None),
+    "prix": lambda content: "Nos tarifs varient selon le service. Dites-moi le service souhaité et je vous oriente.",
+    "lieu": lambda content: next((f["a"] for f in content.get("faq", []) if "où" in f["q"].lower() or "situ" in f["a"].lower()), None),
+    "service": lambda content: "Voici nos services: " + ", ".join(s.get("title") for s in content.get("services", [])) + ". Quel vous intéresse ?",
+}
+
 @app.post("/api/assistant")
-def assistant(msg: ChatMessage):
-    content = (get_content())
+async def assistant(msg: ChatMessage, background: BackgroundTasks):
+    content = await _cached_content()
     text = msg.message.lower()
     reply = None
 
-    # FAQ lookup
-    for item in content.get("faq", []):
-        if any(k in text for k in ["horaire", "heures", "ouvert"]):
-            reply = next((f["a"] for f in content.get("faq", []) if "horaire" in f["q"].lower()), None)
-            break
-        if any(k in text for k in ["prix", "tarif"]):
-            reply = "Nos tarifs varient selon le service. Dites-moi le service souhaité et je vous oriente."
-            break
-        if any(k in text for k in ["où", "adresse", "localisation", "lieu"]):
-            reply = next((f["a"] for f in content.get("faq", []) if "où" in f["q"].lower() or "situ" in f["a"].lower()), None)
-            break
-
-    if not reply:
-        # service suggestion
-        services = [s.get("title") for s in content.get("services", [])]
-        if "service" in text or "choisir" in text or "conseil" in text:
-            reply = "Voici nos services: " + ", ".join(services) + ". Quel vous intéresse ?"
+    # Intent lookup: one scan over the message, replies tried in priority order
+    intents = {m.lastgroup for m in _INTENT_RE.finditer(text)}
+    for intent, make_reply in _INTENT_REPLIES.items():
+        if intent in intents:
+            reply = make_reply(content)
+            if reply:
+                break
 
     if not reply:
         reply = content.get("assistant", ["Je suis là pour vous aider !"])[0]
@@ -257,12 +369,23 @@ def assistant(msg: ChatMessage):
     # Auto create request if contact provided
     created_id = None
     if msg.name and msg.email and msg.phone:
-        req = RequestSchema(name=msg.name, email=msg.email, phone=msg.phone, service_id=None, message=msg.message)
-        created_id = create_document("request", req)
+        try:
+            req = RequestSchema(name=msg.name, email=msg.email, phone=msg.phone, service_id=None, message=msg.message).model_dump()
+        except ValidationError as e:
+            # Same 422 body FastAPI produces for an invalid request field
+            raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors()])
+        # Assign the id up front so the insert can happen after the reply is sent;
+        # fail now rather than hand out an id for a lead that can't be stored
+        require_db()
+        req["_id"] = ObjectId()
+        created_id = str(req["_id"])
+        background.add_task(insert_lead, req)
 
     return {"reply": reply, "created_request_id": created_id}
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    # Import string so each worker process imports the app (and its Mongo client) itself
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers, loop="uvloop", http="httptools")
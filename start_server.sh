@@ -15,5 +15,11 @@ mkdir -p logs
 echo "Installing dependencies..."
 pip install -r requirements.txt
 echo "Starting FastAPI server..."
-nohup uvicorn main:app --host 0.0.0.0 --port 8000 --reload > logs/server.log 2>&1 
+# --reload can't be combined with --workers; set RELOAD=1 for a single-process dev server
+if [ "$RELOAD" = "1" ]; then
+  RUN_ARGS="--reload"
+else
+  RUN_ARGS="--workers ${WEB_CONCURRENCY:-$(nproc 2>/dev/null || echo 1)} --loop uvloop --http httptools"
+fi
+nohup uvicorn main:app --host 0.0.0.0 --port 8000 $RUN_ARGS > logs/server.log 2>&1 
 echo "Server started in background"